@@ -0,0 +1,120 @@
+# pl0_ast.py: Parse tree nodes for PL/0
+#
+# Each node class lists its contents in `fields`, which are also its slots.
+# `tag` picks the visitor method: a node with tag 'WHILE' is passed to
+# accept_while().  Every node records the line and lexer position of the
+# token it started at.
+
+class Node(object):
+    __slots__ = ('lineno', 'lexpos')
+    tag = 'NODE'
+    fields = ()
+
+    def __init__(self, *values, lineno = None, lexpos = None):
+        for (field, value) in zip(self.fields, values):
+            setattr(self, field, value)
+        self.lineno = lineno
+        self.lexpos = lexpos
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__,
+                ', '.join(repr(getattr(self, field)) for field in self.fields))
+
+    def children(self):
+        """Yield the nodes directly under this one, in order"""
+        for field in self.fields:
+            value = getattr(self, field)
+            if isinstance(value, Node):
+                yield value
+            elif isinstance(value, list):
+                for item in value:
+                    yield item
+
+class Bound(Node):
+    """A node that declares or refers to a name.  Name resolution (see
+    pl0_resolver) sets `symbol` to the Symbol the name stands for."""
+    __slots__ = ('symbol',)
+
+    def __init__(self, *values, **where):
+        Node.__init__(self, *values, **where)
+        self.symbol = None
+
+# Declarations
+
+class Program(Node):
+    __slots__ = fields = ('block',)
+    tag = 'PROGRAM'
+
+class Block(Node):
+    # constants, variables and procedures are lists of Const, Var and
+    # Procedure nodes
+    __slots__ = fields = ('constants', 'variables', 'procedures', 'statement')
+    tag = 'BLOCK'
+
+class Const(Bound):
+    __slots__ = fields = ('name', 'value')
+    tag = 'CONST'
+
+class Var(Bound):
+    __slots__ = fields = ('name',)
+    tag = 'VAR'
+
+class Procedure(Bound):
+    __slots__ = fields = ('name', 'block')
+    tag = 'PROCEDURE'
+
+# Statements
+
+class Assign(Node):
+    __slots__ = fields = ('target', 'expression')    # target is a Name
+    tag = 'ASSIGN'
+
+class Call(Node):
+    __slots__ = fields = ('target',)                 # a Name
+    tag = 'CALL'
+
+class Begin(Node):
+    __slots__ = fields = ('statements',)
+    tag = 'BEGIN'
+
+class If(Node):
+    __slots__ = fields = ('condition', 'statement')
+    tag = 'IF'
+
+class While(Node):
+    __slots__ = fields = ('condition', 'statement')
+    tag = 'WHILE'
+
+class Print(Node):
+    __slots__ = fields = ('expression',)
+    tag = 'PRINT'
+
+# Conditions
+
+class Odd(Node):
+    __slots__ = fields = ('expression',)
+    tag = 'ODD'
+
+class Compare(Node):
+    # op is one of 'LT', 'LTE', 'GT', 'GTE', 'E', 'NE'
+    __slots__ = fields = ('lhs', 'op', 'rhs')
+    tag = 'COMPARE'
+
+# Expressions
+
+class BinOp(Node):
+    # op is one of 'PLUS', 'MINUS', 'TIMES', 'DIVIDE'
+    __slots__ = fields = ('op', 'lhs', 'rhs')
+    tag = 'BINOP'
+
+class Negate(Node):
+    __slots__ = fields = ('operand',)
+    tag = 'NEGATE'
+
+class Number(Node):
+    __slots__ = fields = ('value',)
+    tag = 'NUMBER'
+
+class Name(Bound):
+    __slots__ = fields = ('name',)
+    tag = 'NAME'
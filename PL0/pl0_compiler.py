@@ -0,0 +1,330 @@
+#
+# Copyright (c) 2012 Samuel G. D. Williams. <http://www.oriontransfer.co.nz>
+# Copyright (c) 2012 Michal J Wallace. <http://www.michaljwallace.com/>
+# Copyright (c) 2012, 2016 Charles Childers <http://forthworks.com/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+import pl0_parser
+from pl0_ast import Number
+from pl0_node_visitor import NodeVisitor
+from pl0_resolver import Resolver
+from pl0_optimizer import Optimizer, CELL_MIN
+
+# Generated code is kept as a list of Labels (label definitions),
+# Instructions and Comments, and only turned into ngbasm source at the end.
+
+class Label(object):
+    """A label in the generated code.  An Instruction whose operand is a
+    Label refers to its address."""
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'Label(%r)' % self.name
+
+    def asm(self):
+        return ':' + self.name
+
+class Instruction(object):
+    """One ngb instruction, or an assembler directive such as `.data`.  The
+    operand is None, a number, or a Label."""
+    __slots__ = ('op', 'operand')
+
+    def __init__(self, op, operand = None):
+        self.op = op
+        self.operand = operand
+
+    def __repr__(self):
+        return 'Instruction(%r, %r)' % (self.op, self.operand)
+
+    def asm(self):
+        if self.operand is None:
+            return '  ' + self.op
+        elif isinstance(self.operand, Label):
+            return '  %s &%s' % (self.op, self.operand.name)
+        else:
+            return '  %s %d' % (self.op, self.operand)
+
+class Comment(object):
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def asm(self):
+        return '; ' + self.text
+
+def write_code(code, out):
+    """Write `code` to stream `out` as ngbasm source, in one go"""
+    out.write('\n'.join(item.asm() for item in code))
+    out.write('\n')
+
+# AST->ngb translator for operators.  divmod leaves the quotient on top of
+# the remainder.
+ops = {
+    'DIVIDE' : ('divmod', 'swap', 'drop'),    # integer div
+    'TIMES'  : ('mul',),
+    'PLUS'   : ('add',),
+    'MINUS'  : ('sub',),
+}
+
+# The runtime.  Each routine is only emitted if the generated code refers to
+# it.  A string operand names another runtime routine.
+#
+# print writes the number on top of the stack with numout, which writes
+# base 26 with the last digit in upper case, so numbers written one after
+# another can still be told apart.  numout only handles numbers >= 0, so a
+# negative number is written as `-` and its absolute value.
+runtime_code = {
+    'print'          : (('dup',), ('lit', 0), ('lt',),
+                        ('lit', 'print-negative'), ('cjump',),
+                        ('numout',), ('return',)),
+    'print-negative' : (('lit', ord('-')), ('out',),
+                        ('lit', 0), ('swap',), ('sub',),
+                        ('numout',), ('return',)),
+}
+
+# The instruction for each relational operator, and whether its flag is
+# set when the comparison is true (LTE is not GT) or when it is false
+compare_ops = {
+    'LT'     : ('lt', True),
+    'LTE'    : ('gt', False),
+    'GT'     : ('gt', True),
+    'GTE'    : ('lt', False),
+    'E'      : ('eq', True),
+    'NE'     : ('neq', True),
+}
+
+# Instructions that test for the opposite of each other
+opposite = { 'eq' : 'neq', 'neq' : 'eq' }
+
+# Against a constant c, the opposite of `lt c` is `gt c-1`, and the opposite
+# of `gt c` is `lt c+1`
+opposite_against_constant = { 'lt' : ('gt', -1), 'gt' : ('lt', 1) }
+
+def power_of_two(node):
+    """k if node is the Number 2**k for some k > 0, else None"""
+    if node.tag == 'NUMBER' and node.value > 1 and \
+            node.value & (node.value - 1) == 0:
+        return node.value.bit_length() - 1
+    return None
+
+class Compiler(NodeVisitor):
+
+    def __init__(self, iterative = True, optimize = True):
+        super(Compiler, self).__init__(iterative)
+        self.optimize = optimize
+        self.label_id = 0
+        self.code = []
+        self.runtime = {}   # name -> Label of each runtime routine
+
+    def intermediate_label(self, hint = ''):
+        self.label_id += 1
+        return Label('t_' + hint + '_' + repr(self.label_id))
+
+    def runtime_label(self, name):
+        # Referring to a runtime routine is what gets it emitted
+        if name not in self.runtime:
+            self.runtime[name] = Label(name)
+        return self.runtime[name]
+
+    def emit(self, op, operand = None):
+        self.code.append(Instruction(op, operand))
+
+    def emit_ops(self, *ops):
+        for op in ops:
+            self.code.append(Instruction(op))
+
+    def define(self, label):
+        self.code.append(label)
+
+    def comment(self, text):
+        self.code.append(Comment(text))
+
+    def generate(self, node):
+        # Bind every name to its Symbol first, so the code generator only
+        # has to read node.symbol.  Raises ResolveError listing every bad
+        # name in the program.
+        Resolver(self.intermediate_label, iterative = self.iterative) \
+                .resolve(node)
+        if self.optimize:
+            node = Optimizer(self.iterative).optimize(node)
+        return self.visit_node(node)
+
+    def write(self, out):
+        write_code(self.code, out)
+
+    def declarations(self, block):
+        """Generator: allocate the variables of block and yield its
+        procedures"""
+        for var in block.variables:
+            # Allocate static storage space for the variable
+            self.define(var.symbol.label)
+            self.emit('.data', 0)
+
+        for proc in block.procedures:
+            yield proc
+
+    def accept_procedure(self, proc):
+        # Generate any static storage required by the procedure
+        self.comment("Procedure " + proc.name)
+        yield from self.declarations(proc.block)
+
+        # Generate the code for the procedure
+        self.define(proc.symbol.label)
+        yield proc.block.statement
+        self.emit('return')
+
+    def runtime_routines(self):
+        """Emit each runtime routine the code refers to, including those
+        referred to by the routines themselves"""
+        emitted = 0
+        while emitted < len(self.runtime):
+            name = list(self.runtime)[emitted]
+            self.define(self.runtime[name])
+            for (op, *operand) in runtime_code[name]:
+                if operand and isinstance(operand[0], str):
+                    operand = [self.runtime_label(operand[0])]
+                self.emit(op, *operand)
+            emitted += 1
+
+    def accept_program(self, node):
+        self.comment("Globals")
+        yield from self.declarations(node.block)
+
+        self.define(Label('main'))
+        yield node.block.statement
+        self.emit('end')
+
+        self.comment("Runtime")
+        self.runtime_routines()
+
+    def branch(self, condition, target, when):
+        """Generator: emit code that jumps to target if condition is true
+        (if `when` is True) or false (if `when` is False)"""
+        if condition.tag == 'ODD':
+            yield condition.expression
+            self.emit('lit', 1)
+            self.emit('and')
+            if not when:
+                self.emit('lit', 1)
+                self.emit('xor')
+        else:
+            yield condition.lhs
+            (test, sense) = compare_ops[condition.op]
+            rhs = condition.rhs
+            if sense != when and rhs.tag == 'NUMBER' and \
+                    test in opposite_against_constant:
+                (other, step) = opposite_against_constant[test]
+                if CELL_MIN <= rhs.value + step < -CELL_MIN:
+                    (test, sense) = (other, when)
+                    rhs = Number(rhs.value + step)
+            yield rhs
+
+            if sense == when:
+                self.emit(test)
+            elif test in opposite:
+                self.emit(opposite[test])
+            else:
+                self.emit(test)
+                self.emit('lit', -1)
+                self.emit('xor')
+        self.emit('lit', target)
+        self.emit('cjump')
+
+    def accept_while(self, node):
+        # The test is at the bottom, so each time round the loop takes one
+        # cjump
+        top_label = self.intermediate_label("while_start")
+        test_label = self.intermediate_label("while_test")
+
+        self.emit('lit', test_label)
+        self.emit('jump')
+        self.define(top_label)
+        yield node.statement
+        self.define(test_label)
+        yield from self.branch(node.condition, top_label, True)
+
+    def accept_if(self, node):
+        false_label = self.intermediate_label("if_false")
+
+        yield from self.branch(node.condition, false_label, False)
+        yield node.statement
+        self.define(false_label)
+
+    def accept_assign(self, node):
+        yield node.expression
+        self.emit('lit', node.target.symbol.label)
+        self.emit('store')
+
+    def accept_call(self, node):
+        self.emit('lit', node.target.symbol.label)
+        self.emit('call')
+
+    def accept_binop(self, node):
+        # Result of this expression will be on the top of stack
+        yield node.lhs
+
+        # Multiplying by 2**k is a left shift by k
+        shift = power_of_two(node.rhs) if node.op == 'TIMES' else None
+        if shift is not None:
+            self.emit('lit', -shift)
+            self.emit('shift')
+        else:
+            yield node.rhs
+            self.emit_ops(*ops[node.op])
+
+    def accept_negate(self, node):
+        # -x is 0 - x
+        self.emit('lit', 0)
+        yield node.operand
+        self.emit('sub')
+
+    def accept_print(self, node):
+        yield node.expression
+        self.emit('lit', self.runtime_label('print'))
+        self.emit('call')
+
+    def accept_number(self, node):
+        self.emit('lit', node.value)
+
+    def accept_name(self, node):
+        symbol = node.symbol
+        if symbol.kind == 'VARIABLE':
+            self.emit('lit', symbol.label)
+            self.emit('fetch')
+        else:
+            self.emit('lit', symbol.value)
+
+def compile_source(code, iterative = True, optimize = True):
+    """Compile PL/0 source text.  Returns the Compiler, whose `code` is the
+    generated instruction list.  With `iterative`, the tree is walked with
+    an explicit stack, as expressions are parsed, so how deeply expressions
+    nest isn't limited by Python's stack.
+    With `optimize`, expressions are simplified first (see pl0_optimizer)."""
+    parser = pl0_parser.Parser()
+    parser.input(code)
+    program = parser.p_program()
+    compiler = Compiler(iterative, optimize)
+    compiler.generate(program)
+    return compiler
@@ -20,106 +20,119 @@
 # THE SOFTWARE.
 #
 
+import types
+
 class NodeVisitor(object):
+    """
+    Calls accept_<tag>(node) for each node (see pl0_ast), where <tag> is
+    node.tag in lower case, or accept_node() if there is no such method.
+
+    An accept method can visit children by calling visit_node(), or it can be
+    a generator that yields each child to visit and is sent back the result:
+
+        def accept_binop(self, node):
+            lhs = yield node.lhs
+            rhs = yield node.rhs
+            return lhs + rhs
+
+    Generator methods work either way, but with iterative=True they are
+    driven from an explicit stack rather than by recursion, so deeply nested
+    trees don't run into Python's recursion limit.
+    """
+
+    def __init__(self, iterative = False):
+        self.iterative = iterative
+
+        # tag -> bound accept method, built once per visitor
+        self.dispatch = dict((tag, getattr(self, name))
+                for (tag, name) in self.accept_methods().items())
+
+    @classmethod
+    def accept_methods(cls):
+        """Return {tag: method name} for this class, built once per class"""
+        if '_accept_methods' not in cls.__dict__:
+            cls._accept_methods = dict((name[len('accept_'):].upper(), name)
+                    for name in dir(cls)
+                    if name.startswith('accept_') and name != 'accept_node')
+        return cls._accept_methods
 
     def visit_node(self, node):
         if node is None:
             return None
-
-        m = getattr(self, "accept_%s" % node[0].lower(),
-                    self.accept_node)
+        if self.iterative:
+            return self.walk(node)
+
+        result = self.begin(node)
+        if not isinstance(result, types.GeneratorType):
+            return result
+
+        # Recursive: visit each child the generator asks for
+        value = None
+        while True:
+            try:
+                child = result.send(value)
+            except StopIteration as stop:
+                return stop.value
+            value = self.visit_node(child)
+
+    def begin(self, node):
+        """Call the accept method for node.  Returns its result, which is a
+        generator if the method is one."""
+        m = self.dispatch.get(node.tag, self.accept_node)
         return self._invoke_method(m, node)
 
+    def walk(self, node):
+        """Visit node using an explicit stack of generators"""
+        stack = []
+        value = self.start(node, stack)
+        while stack:
+            try:
+                child = stack[-1].send(value)
+            except StopIteration as stop:
+                stack.pop()
+                value = stop.value
+                continue
+            value = self.start(child, stack)
+        return value
+
+    def start(self, node, stack):
+        if node is None:
+            return None
+        result = self.begin(node)
+        if isinstance(result, types.GeneratorType):
+            stack.append(result)
+            return None     # primes the generator
+        return result
+
     def _invoke_method(self, meth, node):
-        """
-        This is ugly. The idea here was to be able to replace
-        "node" in the parameter lists with specific named arguments
-        so you could say, e.g., 'block' rather than 'node[1]'.
-
-        Unfortunately, for the moment, the graphviz walker relies
-        on id(*node), so we have to allow overriding this to pass
-        the actual object.
-
-        NOTE: The graphviz issue could be fixed by moving the
-        symbol name generator up into the parser, so that it always
-        generates a uinque node id. ("BLOCK:0" or ("BLOCK",0) instead
-        of just "BLOCK").
-        """
-        return meth(*node)
-
-    def accept_node(self, *node):
-        """
-        The double layer of indirection here is again because
-        of the different way the graph printer want to use the
-        signature.
-        """
-        return self.visit_children(node)
+        return meth(node)
+
+    def accept_node(self, node):
+        return self.visit_each(node.children())
 
     def visit_children(self, node):
-        return self.visit_expressions(node[1:])
+        return self.visit_expressions(node.children())
 
-    def visit_expressions(self, expressions):
+    def visit_each(self, expressions):
+        """Generator: yield each child node in expressions to be visited.
+        Returns the result as visit_expressions() does."""
         results = []
 
         for expr in expressions:
-            if type(expr) in [list, tuple]:
-                result = self.visit_node(expr)
-                results.append(result)
+            results.append((yield expr))
 
         if len(results) == 1:
             return results[0]
         else:
             return results
 
-
-class Block:
-    def __init__(self):
-        self.constants = {}
-        self.variables  = {}
-        self.procedures = {}
-
-    def define(self, name, value):
-        # if self.constants.has_key(name)
-        self.constants[name] = value
-
-    def update(self, name, value):
-        self.variables[name] = value
-
-    def declare(self, name, value):
-        self.procedures[name] = value
-
-    def debug(self):
-        print("-- Stack Frame --")
-        print("Constants: " + repr(self.constants))
-        print("Variables: " + repr(self.variables))
-        print("Procedures: " + repr(self.procedures))
-
-    def lookup(self, name):
-        if name in self.constants:
-            return ('CONSTANT', self.constants[name],)
-        elif name in self.variables:
-            return ('VARIABLE', self.variables[name],)
-        elif name in self.procedures:
-            return ('PROCEDURE', self.procedures[name],)
-        else:
-            return (False, None,)
-
-class StackingNodeVisitor(NodeVisitor):
-
-    def __init__(self):
-        self.stack = []
-
-    def push(self):
-        self.stack.append(Block())
-
-    def pop(self):
-        return self.stack.pop()
-
-    def find(self, name):
-        for x in range(1, len(self.stack) + 1):
-            defined, value = self.stack[-x].lookup(name)
+    def visit_expressions(self, expressions):
+        results = []
 
-            if defined:
-                return (defined, value, -x,)
+        for expr in expressions:
+            results.append(self.visit_node(expr))
 
-        raise NameError("Undefined name referenced: " + repr(name))
+        if len(results) == 1:
+            return results[0]
+        else:
+            return results
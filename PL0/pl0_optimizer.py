@@ -0,0 +1,182 @@
+# pl0_optimizer.py: Expression simplification for PL/0
+#
+# Rewrites the expressions in a resolved program (see pl0_resolver):
+#
+#   - constants and literals are folded: K * 2 + 1 becomes a single Number
+#   - identities are removed: x + 0, x - 0, x * 1 and x / 1 become x, and
+#     x * 0 becomes 0
+#   - constants are gathered: (x + 1) + 2 becomes x + 3, (x * 2) * 3 becomes
+#     x * 6, and a constant operand of + or * is moved to the right
+#   - negation is pushed into subtraction: a + -b becomes a - b, and 0 - x
+#     and x * -1 become -x
+#
+# PL/0 expressions have no side effects, so dropping or reordering operands
+# never changes what a program does.  Folding follows ngb's arithmetic:
+# 32-bit two's complement, with division truncating towards zero.  Division
+# by zero, and the one division that overflows, are left for run time.
+
+from pl0_ast import Node, BinOp, Negate, Number
+from pl0_node_visitor import NodeVisitor
+
+CELL_MIN = -2 ** 31
+
+def wrap(value):
+    """value as a 32-bit signed cell"""
+    return (value - CELL_MIN) % 2 ** 32 + CELL_MIN
+
+def divide(lhs, rhs):
+    """lhs / rhs as ngb computes it, or None if it can't be done here"""
+    if rhs == 0 or (lhs == CELL_MIN and rhs == -1):
+        return None
+    quotient = abs(lhs) // abs(rhs)
+    return quotient if (lhs < 0) == (rhs < 0) else -quotient
+
+def constant(node):
+    """The value of node if it is a Number, else None"""
+    return node.value if isinstance(node, Number) else None
+
+class Optimizer(NodeVisitor):
+    """Simplify the expressions in a program in place.  Each accept method
+    returns the node that should replace the one it was given."""
+
+    def __init__(self, iterative = True):
+        super(Optimizer, self).__init__(iterative)
+
+    def optimize(self, program):
+        return self.visit_node(program)
+
+    def accept_node(self, node):
+        # Statements and declarations: replace each child with its
+        # simplified form
+        for field in node.fields:
+            value = getattr(node, field)
+            if isinstance(value, Node):
+                setattr(node, field, (yield value))
+            elif isinstance(value, list):
+                for (i, item) in enumerate(value):
+                    value[i] = yield item
+        return node
+
+    def accept_name(self, node):
+        symbol = node.symbol
+        if symbol is not None and symbol.kind == 'CONSTANT':
+            return Number(wrap(symbol.value), lineno = node.lineno,
+                    lexpos = node.lexpos)
+        return node
+
+    def accept_number(self, node):
+        return node
+
+    def accept_negate(self, node):
+        operand = yield node.operand
+        return self.negate(operand, node)
+
+    def accept_binop(self, node):
+        node.lhs = yield node.lhs
+        node.rhs = yield node.rhs
+        return self.simplify(node)
+
+    def negate(self, operand, where):
+        if isinstance(operand, Number):
+            return Number(wrap(-operand.value), lineno = where.lineno,
+                    lexpos = where.lexpos)
+        if isinstance(operand, Negate):
+            return operand.operand
+        if isinstance(operand, BinOp) and operand.op == 'MINUS':
+            # -(a - b) is b - a
+            (operand.lhs, operand.rhs) = (operand.rhs, operand.lhs)
+            return operand
+        return Negate(operand, lineno = where.lineno, lexpos = where.lexpos)
+
+    def simplify(self, node):
+        op = node.op
+        lhs = constant(node.lhs)
+        rhs = constant(node.rhs)
+
+        if lhs is not None and rhs is not None:
+            value = self.fold(op, lhs, rhs)
+            if value is not None:
+                return Number(value, lineno = node.lineno,
+                        lexpos = node.lexpos)
+            return node
+
+        # Keep constant operands of + and * on the right
+        if lhs is not None and op in ('PLUS', 'TIMES'):
+            (node.lhs, node.rhs) = (node.rhs, node.lhs)
+            (lhs, rhs) = (rhs, lhs)
+
+        if op in ('PLUS', 'MINUS'):
+            return self.simplify_sum(node, lhs, rhs)
+        elif op == 'TIMES':
+            return self.simplify_product(node, rhs)
+        elif op == 'DIVIDE':
+            if rhs == 1:
+                return node.lhs
+            elif rhs == -1:
+                return self.negate(node.lhs, node)
+        return node
+
+    def simplify_sum(self, node, lhs, rhs):
+        if lhs == 0:                        # 0 - x
+            return self.negate(node.rhs, node)
+
+        if isinstance(node.rhs, Negate):    # a + -b, a - -b
+            node.rhs = node.rhs.operand
+            node.op = 'MINUS' if node.op == 'PLUS' else 'PLUS'
+        elif isinstance(node.lhs, Negate) and node.op == 'PLUS':
+            # -a + b is b - a
+            (node.lhs, node.rhs) = (node.rhs, node.lhs.operand)
+            node.op = 'MINUS'
+            return node
+
+        if rhs is None:
+            return node
+
+        # x + c: gather with a constant already on the left, as in
+        # (x + c1) - c2
+        offset = rhs if node.op == 'PLUS' else -rhs
+        inner = node.lhs
+        if isinstance(inner, BinOp) and inner.op in ('PLUS', 'MINUS') and \
+                isinstance(inner.rhs, Number):
+            offset += inner.rhs.value if inner.op == 'PLUS' else \
+                    -inner.rhs.value
+            node.lhs = inner.lhs
+        offset = wrap(offset)
+
+        if offset == 0:
+            return node.lhs
+        (node.op, value) = ('PLUS', offset) if offset > 0 else \
+                ('MINUS', wrap(-offset))
+        node.rhs = Number(value, lineno = node.rhs.lineno,
+                lexpos = node.rhs.lexpos)
+        return node
+
+    def simplify_product(self, node, rhs):
+        if rhs is None:
+            return node
+        if rhs == 0:
+            return node.rhs
+        if rhs == 1:
+            return node.lhs
+        if rhs == -1:
+            return self.negate(node.lhs, node)
+
+        inner = node.lhs
+        if isinstance(inner, BinOp) and inner.op == 'TIMES' and \
+                isinstance(inner.rhs, Number):
+            node.lhs = inner.lhs
+            node.rhs = Number(wrap(inner.rhs.value * rhs),
+                    lineno = node.rhs.lineno, lexpos = node.rhs.lexpos)
+            return self.simplify_product(node, node.rhs.value)
+        return node
+
+    def fold(self, op, lhs, rhs):
+        if op == 'PLUS':
+            return wrap(lhs + rhs)
+        elif op == 'MINUS':
+            return wrap(lhs - rhs)
+        elif op == 'TIMES':
+            return wrap(lhs * rhs)
+        elif op == 'DIVIDE':
+            return divide(lhs, rhs)
+        return None
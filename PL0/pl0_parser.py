@@ -23,9 +23,14 @@
 
 import sys
 import pl0_lexer
+from pl0_ast import (Node, Program, Block, Const, Var, Procedure, Assign, Call,
+        Begin, If, While, Print, Odd, Compare, BinOp, Negate, Number, Name)
 
 class ParseError(Exception):
     pass
+
+# How tightly each operator binds
+PRECEDENCE = { 'PLUS': 1, 'MINUS': 1, 'NEGATE': 2, 'TIMES': 3, 'DIVIDE': 3 }
 
 class SymbolParser:
     def __init__(self, lex):
@@ -88,25 +93,33 @@ class Parser(SymbolParser):
     def __init__(self):
         SymbolParser.__init__(self, pl0_lexer.create())
 
+    def where(self):
+        """Position of the current symbol, for the node starting there"""
+        if self.sym:
+            return { 'lineno': self.sym.lineno, 'lexpos': self.sym.lexpos }
+        return { 'lineno': self.lex.lineno, 'lexpos': self.lex.lexpos }
+
     def p_program(self):
+        where = self.where()
         block = self.required(self.p_block(), 'block')
         self.expect_sym('DOT')
         self.get_sym()
 
-        return ('PROGRAM', block,)
+        return Program(block, **where)
 
     def p_block(self):
+        where = self.where()
         const_decl = self.p_const_decl()
         var_decl = self.p_var_decl()
         procedures_decl = self.p_procedures_decl()
         statement = self.p_statement()
 
-        return ('BLOCK', const_decl, var_decl, procedures_decl, statement,)
+        return Block(const_decl, var_decl, procedures_decl, statement, **where)
 
     def p_const_decl(self):
-        if self.is_sym('CONST'):
-            constants = ['CONSTANTS']
+        constants = []
 
+        if self.is_sym('CONST'):
             while True:
                 self.get_sym()
 
@@ -121,10 +134,11 @@ class Parser(SymbolParser):
 
                 self.expect_sym('COMMA')
         else:
-            return None
+            return constants
 
     def p_const_assign(self):
         if self.is_sym('NAME'):
+            where = self.where()
             name = self.sym.value
 
             self.get_sym('const-assign-symbol')
@@ -136,19 +150,19 @@ class Parser(SymbolParser):
 
             self.get_sym()
 
-            return ('DEFINE', name, value,)
+            return Const(name, value, **where)
         else:
             return None
 
     def p_var_decl(self):
-        if self.is_sym('VAR'):
-            names = ['VARIABLES']
+        names = []
 
+        if self.is_sym('VAR'):
             while True:
                 self.get_sym()
                 self.expect_sym('NAME')
 
-                names.append(('NAME', self.sym.value,))
+                names.append(Var(self.sym.value, **self.where()))
 
                 self.get_sym()
 
@@ -158,12 +172,13 @@ class Parser(SymbolParser):
 
                 self.expect_sym('COMMA')
         else:
-            return None
+            return names
 
     def p_procedures_decl(self):
-        procedures = ['PROCEDURES']
+        procedures = []
 
         while self.is_sym('PROCEDURE'):
+            where = self.where()
             self.get_sym()
             self.expect_sym('NAME')
             name = self.sym.value
@@ -176,14 +191,11 @@ class Parser(SymbolParser):
 
             self.expect_sym('EOS')
 
-            procedures.append(('PROCEDURE', name, block,))
+            procedures.append(Procedure(name, block, **where))
 
             self.get_sym()
 
-        if len(procedures) > 1:
-            return procedures
-        else:
-            return None
+        return procedures
 
     def p_statement(self):
         if self.is_sym('NAME'):
@@ -204,7 +216,8 @@ class Parser(SymbolParser):
 
     def p_statement_assign(self):
         if self.is_sym('NAME'):
-            name = ('NAME', self.sym.value,)
+            where = self.where()
+            name = Name(self.sym.value, **where)
 
             self.get_sym()
             self.expect_sym('UPDATE')
@@ -212,26 +225,28 @@ class Parser(SymbolParser):
             self.get_sym()
             expression = self.p_expression()
 
-            return ('SET', name, expression,)
+            return Assign(name, expression, **where)
         else:
             return None
 
     def p_statement_print(self):
         if self.is_sym('PRINT'):
+            where = self.where()
             self.get_sym('print-1')
 
             expression = self.required(self.p_expression(), 'print-expression')
 
-            return ('PRINT', expression)
+            return Print(expression, **where)
         else:
             return None
 
     def p_statement_call(self):
         if self.is_sym('CALL'):
+            where = self.where()
             self.get_sym('call-1')
             self.expect_sym('NAME')
 
-            call = ('CALL', self.sym.value)
+            call = Call(Name(self.sym.value, **self.where()), **where)
             self.get_sym('call-2')
 
             return call
@@ -240,7 +255,8 @@ class Parser(SymbolParser):
 
     def p_statement_begin(self):
         if self.is_sym('BEGIN'):
-            statements = ['BEGIN']
+            where = self.where()
+            statements = []
 
             while True:
                 self.get_sym()
@@ -251,7 +267,7 @@ class Parser(SymbolParser):
 
                 if self.is_sym('END'):
                     self.get_sym()
-                    return statements
+                    return Begin(statements, **where)
 
                 self.expect_sym('EOS')
         else:
@@ -259,6 +275,7 @@ class Parser(SymbolParser):
 
     def p_statement_if(self):
         if self.is_sym('IF'):
+            where = self.where()
             self.get_sym()
             condition = self.p_condition()
 
@@ -267,12 +284,13 @@ class Parser(SymbolParser):
 
             statement = self.p_statement()
 
-            return ('IF', condition, statement,)
+            return If(condition, statement, **where)
         else:
             return None
 
     def p_statement_while(self):
         if self.is_sym('WHILE'):
+            where = self.where()
             self.get_sym('while-1')
 
             condition = self.p_condition()
@@ -282,11 +300,12 @@ class Parser(SymbolParser):
 
             statement = self.p_statement()
 
-            return ('WHILE', condition, statement)
+            return While(condition, statement, **where)
         else:
             return None
 
     def p_condition(self):
+        where = self.where()
         odd = False
 
         if self.is_sym('ODD'):
@@ -296,7 +315,7 @@ class Parser(SymbolParser):
         lhs = self.p_expression()
 
         if odd:
-            return ('ODD', lhs)
+            return Odd(lhs, **where)
 
         elif self.sym.type in ['LT', 'LTE', 'GT', 'GTE', 'E', 'NE']:
             op = self.sym.type
@@ -304,7 +323,7 @@ class Parser(SymbolParser):
 
             rhs = self.p_expression()
 
-            return ('CONDITION', lhs, op, rhs,)
+            return Compare(lhs, op, rhs, **where)
         else:
             self.expect_sym('~comparison-operator')
 
@@ -320,23 +339,69 @@ class Parser(SymbolParser):
         else:
             return None
 
+    # Sequences of operators are left-associative: a - b - c is (a - b) - c.
+    # A leading sign applies to the first term only: -a + b is (-a) + b, and
+    # -a * b is -(a * b).
+    #
+    # Expressions are parsed with explicit stacks of operands and pending
+    # operators rather than by recursion, so parentheses can nest as deeply as
+    # memory allows.  An operator is only applied once the next operator is
+    # known not to bind more tightly.
+
+    def p_expression_start(self, operators):
+        # A sign, which can only start an expression
+        where = self.where()
+        if self.p_term_op() == 'MINUS':
+            operators.append(('NEGATE', where))
+
     def p_expression(self):
-        sign = self.p_term_op()
+        operands = []
+        operators = []      # (operator, where); LPAREN opens a parenthesis
+        self.p_expression_start(operators)
 
-        expression = ['EXPRESSION', sign]
-        lhs = self.required(self.p_term(), 'lhs-term')
+        while True:
+            # An operand
+            if self.is_sym('LPAREN'):
+                operators.append(('LPAREN', self.where()))
+                self.get_sym()
+                self.p_expression_start(operators)
+                continue
 
-        expression.append(lhs)
+            after_factor_op = operators and \
+                    operators[-1][0] in ('TIMES', 'DIVIDE')
+            operands.append(self.required(self.p_factor(),
+                'rhs-factor' if after_factor_op else 'lhs-factor'))
 
-        while True:
-            operator = self.p_term_op()
+            # Then operators, and the ends of parenthesized expressions
+            while True:
+                op_where = self.where()
+                operator = self.p_factor_op() or self.p_term_op()
 
-            if not operator:
-                return expression
+                if operator:
+                    self.reduce(operands, operators, PRECEDENCE[operator])
+                    operators.append((operator, op_where))
+                    break
 
-            operand = self.required(self.p_term(), 'rhs-term')
+                self.reduce(operands, operators, 0)
+                if not operators:
+                    return operands.pop()
 
-            expression.append((operator, operand,))
+                self.expect_sym('RPAREN')
+                self.get_sym()
+                operators.pop()
+
+    def reduce(self, operands, operators, precedence):
+        """Apply the pending operators that bind at least as tightly as
+        `precedence`, back to the innermost open parenthesis"""
+        while operators and operators[-1][0] != 'LPAREN' and \
+                PRECEDENCE[operators[-1][0]] >= precedence:
+            (operator, where) = operators.pop()
+            if operator == 'NEGATE':
+                operands.append(Negate(operands.pop(), **where))
+            else:
+                rhs = operands.pop()
+                lhs = operands.pop()
+                operands.append(BinOp(operator, lhs, rhs, **where))
 
     def p_factor_op(self):
         if self.is_sym('TIMES'):
@@ -350,63 +415,28 @@ class Parser(SymbolParser):
         else:
             return None
 
-    def p_term(self):
-        expression = ['TERM']
-        lhs = self.required(self.p_factor(), 'lhs-factor')
-
-        expression.append(lhs)
-
-        while True:
-            operator = self.p_factor_op()
-
-            if not operator:
-                return expression
-
-            operand = self.required(self.p_factor(), 'rhs-factor')
-
-            expression.append((operator, operand,))
+    # A parenthesized expression is handled by p_expression()
 
     def p_factor(self):
+        where = self.where()
         if self.is_sym('NAME'):
             value = self.sym.value
             self.get_sym()
-            return ('NAME', value)
+            return Name(value, **where)
         elif self.is_sym('NUMBER'):
             value = self.sym.value
             self.get_sym()
-            return ('NUMBER', value)
-        elif self.is_sym('LPAREN'):
-            self.get_sym()
-            expression = self.required(self.p_expression(), 'expression')
-
-            self.expect_sym('RPAREN')
-
-            self.get_sym()
-            return expression
+            return Number(value, **where)
 
-def is_flat(tree):
-    if tree == None:
-        return False
-
-    for val in tree:
-        if type(val) in (list, dict, tuple):
-            return False
-    return True
-
 def print_tree(tree, depth = 0):
-    if is_flat(tree):
-        print("  " * depth + str(tree))
-    elif type(tree) == list or type(tree) == tuple:
-        print_tree(tree[0], depth)
-        for val in tree[1:]:
-            print_tree(val, depth+1)
-    elif type(tree) == dict:
-        for key, val in tree.items():
-            print("  " * depth + str(key))
-            print_tree(val, depth+1)
-    elif tree == None:
-        pass
-    else:
+    if isinstance(tree, Node):
+        scalars = [repr(getattr(tree, field)) for field in tree.fields
+                if not isinstance(getattr(tree, field), (Node, list))]
+        print("  " * depth + ' '.join([tree.tag] + scalars) +
+                "  @%s:%s" % (tree.lineno, tree.lexpos))
+        for child in tree.children():
+            print_tree(child, depth + 1)
+    elif tree is not None:
         print("  " * depth + str(tree))
 
 if __name__ == "__main__":
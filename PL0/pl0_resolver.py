@@ -0,0 +1,110 @@
+# pl0_resolver.py: Name resolution for PL/0
+#
+# Binds every Const, Var, Procedure and Name node to a Symbol, once, before
+# code generation, so the compiler can read node.symbol instead of searching
+# scopes.  All undefined names, duplicate declarations and misuses (e.g.,
+# assigning to a constant) are collected and reported together.
+
+from pl0_node_visitor import NodeVisitor
+
+class Symbol(object):
+    """What a name stands for.  kind is 'CONSTANT', 'VARIABLE' or
+    'PROCEDURE'.  label is the storage label of a variable or the entry
+    label of a procedure; value is the value of a constant.  depth is how
+    deeply nested the declaring block is (0 for the program's block)."""
+    __slots__ = ('name', 'kind', 'label', 'value', 'depth', 'node')
+
+    def __init__(self, name, kind, depth, node, label = None, value = None):
+        self.name = name
+        self.kind = kind
+        self.depth = depth
+        self.node = node
+        self.label = label
+        self.value = value
+
+    def __repr__(self):
+        return 'Symbol(%r, %r, depth=%d)' % (self.name, self.kind, self.depth)
+
+class ResolveError(Exception):
+    """All the name errors in a program.  `errors` lists the messages."""
+    def __init__(self, errors):
+        Exception.__init__(self, '\n'.join(errors))
+        self.errors = errors
+
+class Resolver(NodeVisitor):
+    """Resolve names in a Program.  new_label(hint) makes the label for
+    each variable and procedure."""
+
+    def __init__(self, new_label, source = "<input>", iterative = True):
+        super(Resolver, self).__init__(iterative)
+        self.new_label = new_label
+        self.source = source
+        self.scopes = []    # one dict of name -> Symbol per open block
+        self.errors = []
+
+    def resolve(self, program):
+        self.visit_node(program)
+        if self.errors:
+            raise ResolveError(self.errors)
+        return program
+
+    def error(self, node, message):
+        self.errors.append('%s[%s:%s]: %s' % (self.source, node.lineno,
+                node.lexpos, message))
+
+    def declare(self, node, kind, **what):
+        scope = self.scopes[-1]
+        if node.name in scope:
+            first = scope[node.name].node
+            self.error(node, 'Duplicate declaration of %s (first declared at '
+                    '[%s:%s])' % (node.name, first.lineno, first.lexpos))
+        node.symbol = Symbol(node.name, kind, len(self.scopes) - 1, node,
+                **what)
+        scope[node.name] = node.symbol
+
+    def bind(self, node, kinds, usage):
+        """Bind Name node to the innermost declaration of its name, which
+        must be one of kinds"""
+        for scope in reversed(self.scopes):
+            symbol = scope.get(node.name)
+            if symbol is not None:
+                break
+        else:
+            self.error(node, 'Undefined name %s' % node.name)
+            return
+
+        if symbol.kind not in kinds:
+            self.error(node, '%s %s is a %s' % (usage, node.name,
+                    symbol.kind.lower()))
+        node.symbol = symbol
+
+    def block(self, block):
+        """Generator: declare everything in block, in a new scope, and
+        resolve its statement"""
+        self.scopes.append({})
+
+        for const in block.constants:
+            self.declare(const, 'CONSTANT', value = const.value)
+        for var in block.variables:
+            self.declare(var, 'VARIABLE',
+                    label = self.new_label('var_' + var.name))
+        for proc in block.procedures:
+            self.declare(proc, 'PROCEDURE',
+                    label = self.new_label('proc_' + proc.name))
+            yield from self.block(proc.block)
+
+        yield block.statement
+        self.scopes.pop()
+
+    def accept_program(self, node):
+        yield from self.block(node.block)
+
+    def accept_assign(self, node):
+        self.bind(node.target, ('VARIABLE',), 'Assignment to')
+        yield node.expression
+
+    def accept_call(self, node):
+        self.bind(node.target, ('PROCEDURE',), 'Call to')
+
+    def accept_name(self, node):
+        self.bind(node, ('VARIABLE', 'CONSTANT'), 'Value of')
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# ngbasm-bench.py: Time ngbasm on synthetic programs of various sizes
+#
+# Usage: bench/ngbasm-bench.py [-s LINES ...] [-r N] [-o results.json]
+#                              [--baseline old.json] [--threshold PCT]
+#
+# Each program has many labels, forward references to labels further down,
+# calls into routines spread across a chain of nested includes, and large
+# `.reserve` blocks.  Each phase is timed separately:
+#
+#   clean    reading and tokenizing the main file and all the includes
+#   assemble the first pass
+#   resolve  the second pass, and patching the entry point
+#   save     writing the image
+#
+# Each size is run `-r` times and the fastest time for each phase is kept.
+# Results are written as JSON.  With --baseline, each phase is compared
+# against an earlier results file, and the exit status is 1 if any phase got
+# slower by more than --threshold percent.
+#
+# Uses ngbasm.py if it has been built, and otherwise imports ngbasm.md
+# directly using mdimport.
+
+import sys
+import os
+import json
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        '..'))
+import mdimport
+mdimport.install()
+import ngbasm
+
+PHASES = ('clean', 'assemble', 'resolve', 'save')
+
+def generate(dirname, lines, depth=8, reserve=65536, reserve_block=4096,
+        forward=64):
+    """Write a program of about `lines` lines into `dirname`.
+
+    Returns the name of the main file.  The program is spread over the main
+    file and `depth` includes, each including the next.  Every block of four
+    lines in the main file has a label and a reference `forward` labels
+    ahead.  `reserve` cells are reserved in blocks of `reserve_block`."""
+    nroutines = max(depth, lines // 100)
+    per_file = nroutines // depth
+
+    # The include chain: inc0 includes inc1, ... , each with its routines
+    for level in range(depth):
+        with open(os.path.join(dirname, 'inc{}.nas'.format(level)), 'w') as f:
+            if level + 1 < depth:
+                f.write('.include inc{}.nas\n'.format(level + 1))
+            for r in range(level * per_file, (level + 1) * per_file):
+                f.write(':r{0}\n  lit {0} ; routine {0}\n  add\n  return\n'
+                        .format(r))
+
+    nblocks = max(1, (lines - 3 * per_file * depth) // 4)
+    nreserves = reserve // reserve_block
+    reserve_every = max(1, nblocks // nreserves) if nreserves else 0
+    main = os.path.join(dirname, 'main.nas')
+    with open(main, 'w') as f:
+        f.write('.include inc0.nas\n.const STEP 3\n:main\n')
+        for b in range(nblocks):
+            f.write(':l{}\n'.format(b))
+            f.write('  lit &l{}\n'.format(min(b + forward, nblocks - 1)))
+            f.write("  lit 'A\n")
+            f.write('  call &r{}\n'.format(b % (per_file * depth)))
+            if reserve_every and b % reserve_every == 0 and nreserves:
+                f.write(':buf{}\n  .reserve {}\n'.format(b, reserve_block))
+                nreserves -= 1
+        f.write('  end\n')
+    return main
+
+def time_phases(filename, image):
+    """Assemble `filename` to `image` the way assemble_source() does, timing
+    each phase.  Returns ({phase: seconds}, assembler)."""
+    clock = time.perf_counter
+    times = {}
+    ngbasm.source_cache.clear()
+
+    start = clock()
+    with open(filename) as f:
+        src = list(ngbasm.tokenize(f.read()))
+    dirname = os.path.dirname(filename)
+    for name in sorted(os.listdir(dirname)):
+        if name.startswith('inc'):
+            ngbasm.load_cached_source(os.path.join(dirname, name))
+    times['clean'] = clock() - start
+
+    asm = ngbasm.Assembler()
+    start = clock()
+    asm.reset()
+    asm.filenames.append(filename)
+    asm.preamble()
+    for line in src:
+        asm.assemble(line)
+    asm.assemble([ngbasm.Token('instruction', 'end', 0, 0)])
+    times['assemble'] = clock() - start
+
+    start = clock()
+    asm.resolve_labels()
+    asm.patch_entry()
+    times['resolve'] = clock() - start
+
+    start = clock()
+    asm.save(image)
+    times['save'] = clock() - start
+
+    return (times, asm)
+
+def run(sizes, repeat, **gen_args):
+    results = []
+    for lines in sizes:
+        with tempfile.TemporaryDirectory(prefix='ngbasm-bench') as dirname:
+            main = generate(dirname, lines, **gen_args)
+            actual = 0
+            for name in os.listdir(dirname):
+                with open(os.path.join(dirname, name)) as f:
+                    actual += sum(1 for _ in f)
+            best = None
+            for _ in range(repeat):
+                (times, asm) = time_phases(main,
+                        os.path.join(dirname, 'main.ngb'))
+                if best is None:
+                    best = times
+                else:
+                    best = { p: min(best[p], times[p]) for p in PHASES }
+            results.append({
+                'lines': lines,
+                'source_lines': actual,
+                'cells': asm.i,
+                'labels': len(asm.labels),
+                'fixups': len(asm.fixups),
+                'seconds': best,
+                'total': sum(best.values()),
+            })
+        print('{:>8} lines: {}  total {:.3f}s'.format(lines,
+                '  '.join('{} {:.3f}s'.format(p, best[p]) for p in PHASES),
+                results[-1]['total']), file=sys.stderr)
+    return results
+
+def compare(results, baseline, threshold):
+    """Print each phase against the baseline.  Returns True if none got more
+    than `threshold` percent slower."""
+    ok = True
+    old = { r['lines']: r for r in baseline['results'] }
+    for r in results:
+        if r['lines'] not in old:
+            continue
+        for p in PHASES + ('total',):
+            before = old[r['lines']]['seconds'][p] if p != 'total' else \
+                    old[r['lines']]['total']
+            after = r['seconds'][p] if p != 'total' else r['total']
+            change = 100.0 * (after - before) / before if before else 0.0
+            flag = ''
+            if change > threshold:
+                flag = '  REGRESSION'
+                ok = False
+            print('{:>8} {:<8} {:9.4f}s -> {:9.4f}s {:+7.1f}%{}'.format(
+                    r['lines'], p, before, after, change, flag))
+    return ok
+
+def parse_args():
+    import argparse
+    parser = argparse.ArgumentParser(
+            description='Benchmark ngbasm on synthetic programs')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+',
+            default=[1000, 10000, 100000, 1000000],
+            help='program sizes, in lines')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+            help='runs per size; the fastest is kept')
+    parser.add_argument('--depth', type=int, default=8,
+            help='depth of the include chain')
+    parser.add_argument('--reserve', type=int, default=65536,
+            help='total cells reserved with .reserve')
+    parser.add_argument('-o', '--output', metavar='FILE',
+            help='write results to FILE (default: standard output)')
+    parser.add_argument('--baseline', metavar='FILE',
+            help='compare against results in FILE')
+    parser.add_argument('--threshold', type=float, default=20.0,
+            help='percent slowdown that counts as a regression')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    results = run(args.sizes, args.repeat, depth=args.depth,
+            reserve=args.reserve)
+    doc = {
+        'python': sys.version.split()[0],
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    text = json.dumps(doc, indent=2) + '\n'
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    elif not args.baseline:
+        sys.stdout.write(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            ok = compare(results, json.load(f), args.threshold)
+        exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
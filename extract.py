@@ -1,32 +1,60 @@
 #!/usr/bin/env python3
 # extract.py: Extract source from markdown files
+#
+# Usage: extract.py [--lines] <source.md> <dest> [<source.md> <dest> ...]
+#
+# The code is everything between ```` fences.  A destination is only written
+# if its contents would change, so its modification time (and anything make
+# builds from it) is left alone when only the prose changed.  With --lines,
+# each block of code starts with a `# line <n> "<source.md>"` comment giving
+# the markdown line it came from.
 
 import sys
 import os
 
-def extract_from_markdown(name):
-    v = []
-    with open(name) as f:
-        v = f.readlines()
-    s = []
+def extract_from_markdown(name, lines=False):
+    """Yield the lines of code in markdown file `name`, one at a time"""
     fence = False
-    for l in v:
-        l = l.rstrip()
-        if fence == True and l != '````':
-            s.append(l)
-        elif l == '````' and fence == True:
-            fence = False
-        elif l == '````' and fence == False:
-            fence = True
-    return s
+    mark = None     # the `# line` comment for the block we are starting
+    with open(name) as f:
+        for (lineno, l) in enumerate(f, 1):
+            l = l.rstrip()
+            if fence == True and l != '````':
+                if mark is not None and not l.startswith('#!'):
+                    yield mark
+                    mark = None
+                yield l
+                if mark is not None:    # after a #! line
+                    mark = '# line {} "{}"'.format(lineno + 1, name)
+            elif l == '````' and fence == True:
+                fence = False
+                mark = None
+            elif l == '````' and fence == False:
+                fence = True
+                if lines:
+                    mark = '# line {} "{}"'.format(lineno + 1, name)
 
 
-def convert(s, d):
+def convert(s, d, lines=False):
+    """Extract `s` into `d`.  Returns True if `d` was written."""
+    text = ''.join(line + '\n' for line in extract_from_markdown(s, lines))
+    try:
+        with open(d) as file:
+            if file.read() == text:
+                return False
+    except OSError:
+        pass    # no existing file, so write it
     with open(d, 'w') as file:
-        lines = extract_from_markdown(s)
-        for line in lines:
-            file.write(line)
-            file.write('\n')
+        file.write(text)
+    return True
 
 if __name__ == '__main__':
-    convert(sys.argv[1], sys.argv[2])
+    args = sys.argv[1:]
+    lines = '--lines' in args
+    args = [arg for arg in args if arg != '--lines']
+    if len(args) == 0 or len(args) % 2 != 0:
+        print('Usage: {} [--lines] <source.md> <dest> [<source.md> <dest> ...]'
+                .format(sys.argv[0]), file=sys.stderr)
+        exit(2)
+    for (s, d) in zip(args[0::2], args[1::2]):
+        convert(s, d, lines)
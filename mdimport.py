@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# mdimport.py: Import Python straight from literate markdown files
+#
+# Usage:
+#   import mdimport
+#   mdimport.install()          # now `import ngbasm` can find ngbasm.md
+#
+#   ./mdimport.py ngbasm.md [args...]   # run ngbasm.md as a script
+#
+# The code is whatever is between ```` fences, just as for extract.py.  Prose
+# and fence lines are blanked out rather than removed, so line numbers in the
+# code are line numbers in the markdown, and tracebacks show the markdown.
+#
+# The bytecode is cached in __pycache__ next to the markdown, keyed by a hash
+# of the markdown and by the Python version, so a file is only extracted and
+# compiled again when it changes.  A .py file of the same name always wins, so
+# a module that has been extracted with extract.py is imported as usual.
+
+import sys
+import os
+import hashlib
+import marshal
+import importlib.abc
+import importlib.util
+
+FENCE = '````'
+
+def code_from_markdown(text):
+    """Return the code in `text`, with everything else blanked out"""
+    lines = []
+    fence = False
+    for line in text.split('\n'):
+        line = line.rstrip()
+        if line == FENCE:
+            fence = not fence
+            lines.append('')
+        else:
+            lines.append(line if fence else '')
+    return '\n'.join(lines)
+
+def cache_path(path, digest):
+    """Return the name of the cached bytecode for `path`"""
+    return os.path.join(os.path.dirname(os.path.abspath(path)), '__pycache__',
+            '{}.{}.{}.pyc'.format(os.path.basename(path), digest,
+                sys.implementation.cache_tag))
+
+def write_cache(filename, data):
+    """Write `data` to `filename` so that readers never see half a file"""
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    temp = '{}.{}'.format(filename, os.getpid())
+    with open(temp, 'wb') as f:
+        f.write(data)
+    os.replace(temp, filename)
+
+def prune_cache(path, keep):
+    """Remove bytecode cached for `path` by this version of Python, other than
+    `keep`.  Caches for other versions are left for them."""
+    (cache, keep) = os.path.split(keep)
+    prefix = os.path.basename(path) + '.'
+    suffix = '.{}.pyc'.format(sys.implementation.cache_tag)
+    for name in os.listdir(cache):
+        if name.startswith(prefix) and name.endswith(suffix) and name != keep:
+            os.remove(os.path.join(cache, name))
+
+def load_code(path):
+    """Return the compiled code in markdown file `path`, from the cache if
+    possible"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    bytecode_cache = cache_path(path, digest)
+    magic = importlib.util.MAGIC_NUMBER
+
+    try:
+        with open(bytecode_cache, 'rb') as f:
+            if f.read(len(magic)) == magic:
+                return marshal.loads(f.read())
+    except (OSError, ValueError, EOFError):
+        pass    # not cached, or the cache is unreadable
+
+    source = code_from_markdown(data.decode('utf-8'))
+    code = compile(source, path, 'exec', dont_inherit=True)
+    try:
+        write_cache(bytecode_cache, magic + marshal.dumps(code))
+        prune_cache(path, bytecode_cache)
+    except OSError:
+        pass    # e.g., read-only directory: just don't cache
+    return code
+
+def is_literate(path):
+    """Only markdown files with code fences count as modules"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return any(line.rstrip() == FENCE for line in f)
+    except (OSError, UnicodeDecodeError):
+        return False
+
+class MarkdownLoader(importlib.abc.Loader):
+    def __init__(self, path):
+        self.path = path
+
+    def create_module(self, spec):
+        return None     # the default module
+
+    def exec_module(self, module):
+        exec(load_code(self.path), module.__dict__)
+
+class MarkdownFinder(importlib.abc.MetaPathFinder):
+    def find_spec(self, fullname, path=None, target=None):
+        name = fullname.rpartition('.')[2]
+        for entry in (sys.path if path is None else path):
+            candidate = os.path.join(entry or os.getcwd(), name + '.md')
+            if os.path.isfile(candidate) and is_literate(candidate):
+                return importlib.util.spec_from_file_location(fullname,
+                        candidate, loader=MarkdownLoader(candidate))
+        return None
+
+def install():
+    """Let `import` find literate markdown files.  The finder goes last, so
+    .py files and packages are found first."""
+    if not any(isinstance(f, MarkdownFinder) for f in sys.meta_path):
+        sys.meta_path.append(MarkdownFinder())
+
+def run(path, args):
+    """Run markdown file `path` as the main program, with arguments `args`.
+    As with `python -m`, the module is named `__main__` but its spec has its
+    own name."""
+    install()
+    code = load_code(path)
+    sys.argv = [path] + list(args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path,
+            loader=MarkdownLoader(path))
+    module = importlib.util.module_from_spec(spec)
+    module.__name__ = '__main__'
+    sys.modules['__main__'] = module
+    exec(code, module.__dict__)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: {} <file.md> [args...]'.format(sys.argv[0]),
+                file=sys.stderr)
+        exit(2)
+    run(sys.argv[1], sys.argv[2:])
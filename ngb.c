@@ -13,6 +13,7 @@
 
 #include <stdio.h>
 #include <stdlib.h>
+#include <stdint.h>
 #include <unistd.h>
 #include <string.h>
 #include <setjmp.h>
@@ -60,6 +61,12 @@ CELL memory[IMAGE_SIZE] = {0};
 int stats[NUM_OPS] = {0};
 int max_sp, max_rp;
 
+// Profiling: how many times each address was executed, and how many times
+// each address was the target of a call.  Only allocated when profiling.
+char *profile_file = NULL;
+uint64_t *exec_counts = NULL;
+uint64_t *call_counts = NULL;
+
 #define TOS  (data[sp])
 #define NOS  (data[sp-1])
 #define TORS (address[rp])
@@ -89,12 +96,52 @@ void shutdown_terminal() {
   tcsetattr(STDIN_FILENO, TCSANOW, &old_termios);
 }
 
+// Images are either raw cells, or compact images (see "Compact images" in
+// ngbasm.md): "NGBZ", version, cell count, then chunks of
+// <n> <n literal cells> <number of zero cells>.  Memory is already zero, so
+// zero runs are skipped rather than read.
+CELL ngbLoadCompactImage(FILE *fp, char *imageFile) {
+  CELL header[2], count, imageSize, i = 0;
+
+  if (fread(header, sizeof(CELL), 2, fp) != 2 || header[0] != 1 ||
+      header[1] < 0 || header[1] > IMAGE_SIZE) {
+    fprintf(stderr, "%s: bad compact image header\n", imageFile);
+    exit(1);
+  }
+  imageSize = header[1];
+
+  while (i < imageSize) {
+    if (fread(&count, sizeof(CELL), 1, fp) != 1 || count < 0 ||
+        count > imageSize - i ||
+        fread(&memory[i], sizeof(CELL), count, fp) != (size_t)count) {
+      fprintf(stderr, "%s: compact image is truncated\n", imageFile);
+      exit(1);
+    }
+    i += count;
+
+    if (fread(&count, sizeof(CELL), 1, fp) != 1 || count < 0 ||
+        count > imageSize - i) {
+      fprintf(stderr, "%s: compact image is truncated\n", imageFile);
+      exit(1);
+    }
+    i += count;
+  }
+  return imageSize;
+}
+
 CELL ngbLoadImage(char *imageFile) {
   FILE *fp;
   CELL imageSize;
   long fileLen;
+  char magic[4];
 
   if ((fp = fopen(imageFile, "rb")) != NULL) {
+    if (fread(magic, 1, 4, fp) == 4 && memcmp(magic, "NGBZ", 4) == 0) {
+      imageSize = ngbLoadCompactImage(fp, imageFile);
+      fclose(fp);
+      return imageSize;
+    }
+
     /* Determine length (in cells) */
     fseek(fp, 0, SEEK_END);
     fileLen = ftell(fp) / sizeof(CELL);
@@ -183,6 +230,62 @@ void ngbDisplayStats()
   printf("Total opcodes processed: %d\n", i);
 }
 
+// Profiling ===============================================================
+
+void ngbStartProfile() {
+  exec_counts = calloc(IMAGE_SIZE, sizeof(uint64_t));
+  call_counts = calloc(IMAGE_SIZE, sizeof(uint64_t));
+  if(!exec_counts || !call_counts) {
+    fprintf(stderr, "Not enough memory to profile\n");
+    exit(1);
+  }
+}
+
+// Called before each instruction runs, so the call target is still on the
+// stack.  A ccall only counts if it will be taken.
+void ngbProfile() {
+  CELL target;
+
+  exec_counts[ip]++;
+  if(memory[ip] == VM_CALL || (memory[ip] == VM_CCALL && NOS != VM_FALSE)) {
+    target = TOS;
+    if(target >= 0 && target < IMAGE_SIZE)
+      call_counts[target]++;
+  }
+}
+
+// Profile file format, all little-endian:
+//   "NGBP"                            magic
+//   uint32 version (1)
+//   uint32 number of records
+//   records: uint32 address, uint64 executions, uint64 calls
+// Only addresses with a nonzero count have a record.
+void ngbSaveProfile(char *profileFile) {
+  FILE *fp;
+  uint32_t version = 1, nrecs = 0, addr;
+
+  if ((fp = fopen(profileFile, "wb")) == NULL) {
+    fprintf(stderr, "Unable to write the profile %s\n", profileFile);
+    return;
+  }
+
+  for (addr = 0; addr < IMAGE_SIZE; addr++)
+    if (exec_counts[addr] || call_counts[addr])
+      nrecs++;
+
+  fwrite("NGBP", 1, 4, fp);
+  fwrite(&version, sizeof(version), 1, fp);
+  fwrite(&nrecs, sizeof(nrecs), 1, fp);
+  for (addr = 0; addr < IMAGE_SIZE; addr++) {
+    if (exec_counts[addr] || call_counts[addr]) {
+      fwrite(&addr, sizeof(addr), 1, fp);
+      fwrite(&exec_counts[addr], sizeof(uint64_t), 1, fp);
+      fwrite(&call_counts[addr], sizeof(uint64_t), 1, fp);
+    }
+  }
+  fclose(fp);
+}
+
 // VM instructions =========================================================
 
 void inst_nop() {
@@ -481,6 +584,8 @@ char *instr_names[NUM_OPS] = {
 
 void ngbProcessOpcode() {
   stats[memory[ip]]++;
+  if(exec_counts)
+    ngbProfile();
   instructions[memory[ip]]();
 }
 
@@ -488,18 +593,26 @@ void ngbProcessOpcode() {
 
 int main(int argc, char **argv) {
   char *filename = "ngbImage";  // default
+  int arg = 1;
   ngbPrepare();
 
-  // Check command line
-  if (argc>1 && strcmp(argv[1], "-g")==0) {
-    Debugging = 1;
-    if(argc>2) filename = argv[2];
-
-  } else if (argc>1) {
-    filename = argv[1];
+  // Check command line: ngb [-g] [-p profile] [image]
+  while (arg<argc && argv[arg][0]=='-') {
+    if (strcmp(argv[arg], "-g")==0) {
+      Debugging = 1;
+    } else if (strcmp(argv[arg], "-p")==0 && arg+1<argc) {
+      profile_file = argv[++arg];
+    } else {
+      fprintf(stderr, "Usage: %s [-g] [-p profile] [image]\n", argv[0]);
+      exit(2);
+    }
+    ++arg;
   }
+  if (arg<argc) filename = argv[arg];
 
   ngbLoadImage(filename);
+  if(profile_file)
+    ngbStartProfile();
 
   CELL opcode, i;
 
@@ -539,6 +652,9 @@ int main(int argc, char **argv) {
 
   shutdown_terminal();
 
+  if(profile_file)
+    ngbSaveProfile(profile_file);
+
   if(Debugging) {
     int bot = sp-100;   // print up to the top 100 stack entries
     if(bot<1) { bot = 1; }
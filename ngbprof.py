@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# ngbprof.py: Report on a profile written by `ngb -p <profile> <image>`
+#
+# Usage: ngbprof.py [-n N] <image.ngb> <profile> [<image.map>]
+#
+# The map is the source map written by `ngbasm.py --map`.  If it isn't given,
+# the image name with a `.map` extension is used.  Counts are in instructions
+# executed, which is the closest thing ngb has to time.
+#
+# A routine starts at *:main* or at any address that was called, and runs up
+# to the start of the next routine.  Routines are named by the labels in the
+# source map, so local labels such as `:loop` stay part of their routine.
+# Cumulative counts are estimated the way gprof does: a routine is charged for
+# its callees' cumulative counts in proportion to the share of their calls it
+# made.  Recursion is not charged twice.
+
+import sys
+import os
+import struct
+from array import array
+from bisect import bisect_right
+
+# Opcodes we need to know about
+LIT, JUMP, CALL, CCALL, CJUMP = 1, 7, 8, 9, 29
+
+def load_profile(filename):
+    """Return {address: (executions, calls)}"""
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if data[:4] != b'NGBP':
+        raise ValueError('{} is not an ngb profile'.format(filename))
+    (version, nrecs) = struct.unpack_from('<II', data, 4)
+    if version != 1:
+        raise ValueError('{}: unknown profile version {}'.format(
+                filename, version))
+    profile = {}
+    for (addr, execs, calls) in struct.iter_unpack('<IQQ',
+            data[12:12 + 20 * nrecs]):
+        profile[addr] = (execs, calls)
+    return profile
+
+def load_image(filename):
+    """Load a normal or compact image (see ngbasm.md)"""
+    raw = array('i')
+    with open(filename, 'rb') as f:
+        data = f.read()
+    compact = data[:4] == b'NGBZ'
+    raw.frombytes(data[4:] if compact else data)
+    if sys.byteorder != 'little':
+        raw.byteswap()
+    if not compact:
+        return raw
+
+    cells = array('i')
+    (version, size) = raw[0:2]
+    if version != 1:
+        raise ValueError('{}: unknown image version {}'.format(
+                filename, version))
+    pos = 2
+    while len(cells) < size:
+        count = raw[pos]
+        cells.extend(raw[pos + 1:pos + 1 + count])
+        pos += 1 + count
+        cells.frombytes(bytes(4 * raw[pos]))     # a run of zeros
+        pos += 1
+    return cells
+
+class SourceMap:
+    """Address ranges from a source map, for looking up labels and lines"""
+    def __init__(self, filename=None):
+        self.ranges = []
+        if filename is not None and os.path.exists(filename):
+            with open(filename) as f:
+                for line in f:
+                    (start, end, srcname, lineno, label) = \
+                            line.rstrip('\n').split('\t')
+                    self.ranges.append((int(start), int(end), srcname,
+                            int(lineno), label))
+        self.starts = [r[0] for r in self.ranges]
+
+    def find(self, addr):
+        idx = bisect_right(self.starts, addr) - 1
+        if idx >= 0 and addr < self.ranges[idx][1]:
+            return self.ranges[idx]
+        return None
+
+    def label(self, addr):
+        found = self.find(addr)
+        if found is None:
+            return '(preamble)' if addr < 3 else '({})'.format(addr)
+        return found[4]
+
+    def where(self, addr):
+        found = self.find(addr)
+        if found is None:
+            return '-'
+        return '{}:{}'.format(os.path.basename(found[2]), found[3])
+
+def static_target(cells, profile, site):
+    """If the instruction at `site` is preceded by `lit <x>`, return x."""
+    if site >= 2 and cells[site - 2] == LIT and site - 2 in profile:
+        return cells[site - 1]
+    return None
+
+class Report:
+    def __init__(self, cells, profile, srcmap):
+        self.cells = cells
+        self.profile = profile
+        self.map = srcmap
+        self.total = sum(execs for (execs, calls) in profile.values())
+
+        entries = set(addr for (addr, (execs, calls)) in profile.items()
+                if calls)
+        if len(cells) > 1:
+            entries.add(cells[1])   # the preamble jumps to :main
+        self.entries = sorted(entries)
+
+        self.self_count = {}
+        self.calls = {}
+        self.edges = {}     # (caller, callee) -> calls
+        for (addr, (execs, calls)) in profile.items():
+            name = self.routine(addr)
+            self.self_count[name] = self.self_count.get(name, 0) + execs
+            self.calls[name] = self.calls.get(name, 0) + calls
+            if execs and addr < len(cells) and cells[addr] in (CALL, CCALL):
+                target = static_target(cells, profile, addr)
+                callee = '(indirect)' if target is None else \
+                        self.routine(target)
+                key = (name, callee)
+                self.edges[key] = self.edges.get(key, 0) + execs
+
+        self.inclusive = {}
+        for name in self.self_count:
+            self.cumulative(name, set())
+
+    def routine(self, addr):
+        idx = bisect_right(self.entries, addr) - 1
+        if idx < 0:
+            return self.map.label(addr)
+        return self.map.label(self.entries[idx])
+
+    def cumulative(self, name, active):
+        if name in self.inclusive:
+            return self.inclusive[name]
+        active.add(name)
+        total = self.self_count.get(name, 0)
+        for ((caller, callee), n) in self.edges.items():
+            if caller != name or callee in active or not self.calls.get(callee):
+                continue
+            share = min(1.0, n / self.calls[callee])
+            total += share * self.cumulative(callee, active)
+        active.discard(name)
+        self.inclusive[name] = total
+        return total
+
+    def pct(self, n):
+        return 100.0 * n / self.total if self.total else 0.0
+
+    def flat(self, limit, out):
+        print('Flat profile ({} instructions executed)'.format(self.total),
+                file=out)
+        print('{:>7} {:>7} {:>12} {:>9} {:>12}  {}'.format('%self', 'cumul%',
+                'self', 'calls', 'cumulative', 'routine'), file=out)
+        running = 0
+        rows = sorted(self.self_count.items(), key=lambda kv: -kv[1])
+        for (name, n) in rows[:limit]:
+            running += n
+            print('{:7.2f} {:7.2f} {:12d} {:9d} {:12.0f}  {}'.format(
+                    self.pct(n), self.pct(running), n,
+                    self.calls.get(name, 0), self.inclusive[name], name),
+                    file=out)
+
+    def by_cumulative(self, limit, out):
+        print('Cumulative profile', file=out)
+        print('{:>7} {:>12} {:>12}  {}'.format('%cumul', 'cumulative',
+                'self', 'routine'), file=out)
+        rows = sorted(self.inclusive.items(), key=lambda kv: -kv[1])
+        for (name, n) in rows[:limit]:
+            print('{:7.2f} {:12.0f} {:12d}  {}'.format(self.pct(n), n,
+                    self.self_count[name], name), file=out)
+
+    def call_graph(self, limit, out):
+        print('Call graph', file=out)
+        print('{:>9} {:>12}  {}'.format('calls', 'cumulative', 'caller -> callee'),
+                file=out)
+        weighted = []
+        for ((caller, callee), n) in self.edges.items():
+            calls = self.calls.get(callee)
+            share = min(1.0, n / calls) if calls else 0.0
+            weight = share * self.inclusive.get(callee, 0)
+            weighted.append((weight, n, caller, callee))
+        weighted.sort(key=lambda w: (-w[0], -w[1]))
+        for (weight, n, caller, callee) in weighted[:limit]:
+            print('{:9d} {:12.0f}  {} -> {}'.format(n, weight, caller, callee),
+                    file=out)
+
+    def loops(self, limit, out):
+        """Backward jumps and cjumps, costed by the instructions in the body"""
+        print('Hot loops', file=out)
+        print('{:>7} {:>12} {:>9}  {}'.format('%total', 'body', 'header',
+                'loop'), file=out)
+        found = []
+        for (addr, (execs, calls)) in self.profile.items():
+            if not execs or addr >= len(self.cells) or \
+                    self.cells[addr] not in (JUMP, CJUMP):
+                continue
+            target = static_target(self.cells, self.profile, addr)
+            if target is None or not 0 <= target <= addr:
+                continue
+            body = sum(self.profile[a][0] for a in range(target, addr + 1)
+                    if a in self.profile)
+            header = self.profile.get(target, (0, 0))[0]
+            found.append((body, header, target, addr))
+        found.sort(key=lambda f: -f[0])
+        for (body, header, target, addr) in found[:limit]:
+            print('{:7.2f} {:12d} {:9d}  {} {}..{} ({})'.format(self.pct(body),
+                    body, header, self.map.label(target), target, addr,
+                    self.map.where(target)), file=out)
+
+    def lines(self, limit, out):
+        print('Hot lines', file=out)
+        print('{:>7} {:>12}  {}'.format('%total', 'count', 'line'), file=out)
+        per_line = {}
+        for (addr, (execs, calls)) in self.profile.items():
+            where = (self.map.where(addr), self.map.label(addr))
+            per_line[where] = per_line.get(where, 0) + execs
+        rows = sorted(per_line.items(), key=lambda kv: -kv[1])
+        for ((where, label), n) in rows[:limit]:
+            print('{:7.2f} {:12d}  {} ({})'.format(self.pct(n), n, where,
+                    label), file=out)
+
+    def write(self, limit=20, out=sys.stdout):
+        for section in (self.flat, self.by_cumulative, self.call_graph,
+                self.loops, self.lines):
+            section(limit, out)
+            print(file=out)
+
+def parse_args():
+    import argparse
+    parser = argparse.ArgumentParser(
+            description='Report on an ngb execution profile')
+    parser.add_argument('image', help='image that was profiled')
+    parser.add_argument('profile', help='profile written by ngb -p')
+    parser.add_argument('map', nargs='?',
+            help='source map (default: image name with .map)')
+    parser.add_argument('-n', '--limit', type=int, default=20,
+            help='rows to show in each section')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    srcmap = SourceMap(args.map or os.path.splitext(args.image)[0] + '.map')
+    try:
+        report = Report(load_image(args.image), load_profile(args.profile),
+                srcmap)
+    except (OSError, ValueError, struct.error) as e:
+        print(e, file=sys.stderr)
+        exit(1)
+    report.write(args.limit)
+
+if __name__ == '__main__':
+    main()
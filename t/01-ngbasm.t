@@ -2,6 +2,7 @@ use rlib 'lib';
 use DTest;
 use Test::Cmd;
 use File::Slurp;
+use File::Temp qw(tempdir);
 #use Data::Dumper;
 use Test::OnlySome::RerunFailed;
 
@@ -21,7 +22,8 @@ sub test {  # Run ngb and test the output {{{1
 
         $test->write('src', $in);
         my $status = $test->run(
-            args => "@{[$test->workpath('src')]} @{[$test->workpath('dest')]}"
+            args => ($args{flags} // '') .
+                " @{[$test->workpath('src')]} @{[$test->workpath('dest')]}"
         );
 
         if($args{shouldfail}) {
@@ -140,5 +142,329 @@ test(":main\nlit 42", ['err', '', 'No stderr'],
 test(":main\nlit", {shouldfail=>true},
     ['err', \'requires an operand', 'Lit requires operand']);
 
+# Test that output is quiet by default but not with -v
+test(":main\nnop", ['out', '', 'Quiet by default']);
+test(":main\nnop", {flags=>'-v'},
+    ['out', \'label =  :main', 'Verbose output with -v']);
+
+# Test forward and backward label references
+test(":main\njump &foo\n:foo\njump &main", ['err', '', 'No stderr'],
+    ['result', $preamble . asm(1, 6, 7, 1, 3, 7) . $end,
+        'Forward and backward label references']);
+
+# Test duplicate labels
+test(":main\n:foo\nnop\n:foo\nnop", {shouldfail=>true},
+    ['err', \'Duplicate label foo', 'Duplicate labels cause failure']);
+
+# Test bad operands
+test(":main\nlit 3000000000", {shouldfail=>true},
+    ['err', \'2:5: Value does not fit in a cell', 'Oversized lit fails']);
+test(":main\n.data 3000000000", {shouldfail=>true},
+    ['err', \'2:7: Value does not fit in a cell', 'Oversized .data fails']);
+test(":main\n.reserve foo", {shouldfail=>true},
+    ['err', \'2:10: Expected a number', 'Non-numeric .reserve fails']);
+test(":main\nlit '", {shouldfail=>true},
+    ['err', \"2:5: Missing character after '", 'Empty character fails']);
+test(":main\n.include nosuch.nas", {shouldfail=>true},
+    ['err', \'2:10: Cannot include nosuch.nas', 'Missing include fails']);
+
+# Test .pragma once.  Without it, including src from src would recurse forever.
+test(":main\n.pragma once\n.include src\nnop", ['err', '', 'No stderr'],
+    ['result', $preamble . asm(0) . $end, '.pragma once']);
+test(":main\n.pragma twice", {shouldfail=>true},
+    ['err', \'Unknown pragma', 'Unknown pragma causes failure']);
+
+# Test the peephole optimizer
+test(":main\nlit 2\nlit 3\nadd\nadd 0\ndup\ndrop\nnop\ncall &main\nreturn",
+    {flags=>'-O'}, ['err', '', 'No stderr'],
+    ['result', $preamble . asm(1, 5, 1, 3, 7) . $end, 'Peephole optimizer']);
+test(":main\ncall &main\n:keep\nreturn", {flags=>'-O'},
+    ['result', $preamble . asm(1, 3, 8, 10) . $end,
+        'Peephole optimizer respects labels']);
+test(":main\ncall &used\nend\n:unused\nlit &unused\nreturn\n" .
+        ":used\nlit &data\nreturn\n:fall\nend\n:data\n.data 1",
+    {flags=>'--strip'},
+    ['err', \'Stripped 4 of', 'Stripping reports savings'],
+    ['out', '', 'Stripping prints nothing on stdout'],
+    ['result', $preamble . asm(1, 7, 8, 26, 1, 10, 10, 1) . $end,
+        'Stripping removes unreachable blocks']);
+test(":main\nnop\ncall &f2\nend\n:f0\nreturn\n:f2\nlit 7\nnumout\n" .
+        ":f3\nlit 103\nnumout\nreturn",
+    {flags=>'-O --strip'},
+    ['err', \'Stripped 1 of', 'Stripping after -O reports savings'],
+    ['result', $preamble . asm(1, 7, 8, 26, 1, 7, 32, 1, 103, 32, 10) . $end,
+        'Stripping after -O keeps blocks that are fallen into']);
+
+# Test image format: each cell is a 4-byte little-endian signed integer,
+# whether written directly or through mmap.
+my $imgsrc = ":main\nlit -1\nlit 'A\nlit &data\nend\n:data\n.data 305419896\n" .
+                ".data -2147483648\n.reserve 3\n.data &main";
+my $imgbin = $preamble . asm(1, -1, 1, 65, 1, 10, 26, 305419896,
+                -2147483648, 0, 0, 0, 3) . $end;
+test($imgsrc, ['err', '', 'No stderr'],
+    ['result', $imgbin, 'Image format']);
+test($imgsrc, {flags=>'--mmap'}, ['err', '', 'No stderr'],
+    ['result', $imgbin, 'Image format via mmap']);
+
+# Test compact images: runs of four or more zeros are left out
+test(":main\nend\n:buf\n.reserve 10\n.data 7\n.reserve 3", {flags=>'-z'},
+    ['err', '', 'No stderr'],
+    ['result', 'NGBZ' . asm(1, 19, 4, 1, 3, 7, 26, 10, 5, 7, 0, 0, 0, 26, 0),
+        'Compact image']);
+
+# Test separate assembly: object files and the linker
+{
+    my $test = Test::Cmd->new(prog=>'./ngbasm.py', workdir=>'') or
+        die "Could not create test object for separate assembly";
+    $test->write('one.nas', ":main\nlit K\ncall &helper\nend");
+    $test->write('two.nas', ".const K 7\n:helper\nlit K\nadd\nreturn");
+    my $status = 0;
+    for my $name (qw(one two)) {
+        $status ||= $test->run(args => "-c @{[$test->workpath(\"$name.nas\")]}");
+    }
+    $status ||= $test->run(args => "--link @{[$test->workpath('one.nobj')]} " .
+        "@{[$test->workpath('two.nobj')]} -o @{[$test->workpath('linked')]}");
+    is($status, 0, 'Separate assembly and link succeed');
+
+    my $result;
+    $test->read(\$result, 'linked');
+    is(unpack('H*', $result // ''),
+        unpack('H*', $preamble . asm(1, 7, 1, 9, 8, 26, 1, 7, 17, 10) . $end),
+        'Linked image');
+
+    # Objects don't say which cells are code, so there is nothing for -O or
+    # --strip to work on
+    isnt($test->run(args => "-c -O @{[$test->workpath('one.nas')]}"), 0,
+        '-c rejects -O');
+    isnt($test->run(args => "--strip --link @{[$test->workpath('one.nobj')]} " .
+        "-o @{[$test->workpath('stripped')]}"), 0, '--link rejects --strip');
+}
+
+# An include that isn't UTF-8 is reported at the .include, not as a bad operand
+{
+    my $test = Test::Cmd->new(prog=>'./ngbasm.py', workdir=>'') or
+        die "Could not create test object for a bad include";
+    $test->write('latin1.nas', "lit '\xe9\n");
+    $test->write('main.nas', ":main\n  .include latin1.nas\nend");
+    my $status = $test->run(args => join(' ', map { $test->workpath($_) }
+        qw(main.nas main.ngb)));
+    isnt($status, 0, 'Undecodable include fails');
+    like($test->stderr, qr/main\.nas:2:12: Cannot include latin1\.nas/,
+        'Undecodable include is reported at the .include');
+}
+
+# Test batch assembly: a unit that fails doesn't stop the others
+for my $jobs (1, 2) {
+    my $test = Test::Cmd->new(prog=>'./ngbasm.py', workdir=>'') or
+        die "Could not create test object for batch assembly";
+    $test->write('good.nas', ":main\nlit 1\nend");
+    $test->write('bad.nas', ":main\nlit 3000000000");
+    my $status = $test->run(args => "-j $jobs --batch " .
+        join(' ', map { $test->workpath($_) }
+            qw(bad.nas bad.ngb good.nas good.ngb)));
+    isnt($status, 0, "Batch with a failing unit fails (-j $jobs)");
+    like($test->stdout, qr/1 failed/, "Batch reports the failure (-j $jobs)");
+    like($test->stderr, qr/bad\.nas:2:5: Value does not fit in a cell/,
+        "Batch reports where the failing unit went wrong (-j $jobs)");
+
+    my $result;
+    $test->read(\$result, 'good.ngb');
+    is(unpack('H*', $result // ''),
+        unpack('H*', $preamble . asm(1, 1, 26) . $end),
+        "Batch still assembles the other units (-j $jobs)");
+}
+
+# Test that a batch applies the options to each unit
+{
+    my $test = Test::Cmd->new(prog=>'./ngbasm.py', workdir=>'') or
+        die "Could not create test object for batch options";
+    $test->write('src.nas', ":main\nend\n:unused\nreturn\n:buf\n.reserve 10");
+    my $status = $test->run(args => "-j 1 -z --strip --map -MD --batch " .
+        "@{[$test->workpath('src.nas')]} @{[$test->workpath('src.ngb')]}");
+    is($status, 0, 'Batch with options succeeds');
+
+    my $result;
+    $test->read(\$result, 'src.ngb');
+    is(unpack('H*', $result // ''),
+        unpack('H*', 'NGBZ' . asm(1, 5, 5, 1, 3, 7, 26, 26, 0)),
+        'Batch strips and compacts each image');
+    ok(-e $test->workpath('src.map'), 'Batch writes source maps');
+    ok(-e $test->workpath('src.d'), 'Batch writes dependency files');
+
+    $status = $test->run(args => "-MF deps.d --batch " .
+        "@{[$test->workpath('src.nas')]} @{[$test->workpath('src.ngb')]}");
+    isnt($status, 0, 'Batch rejects -MF');
+}
+
+# Test source maps
+{
+    my $test = Test::Cmd->new(prog=>'./ngbasm.py', workdir=>'') or
+        die "Could not create test object for source maps";
+    $test->write('src.nas', ":main\nlit 1\n\n:loop\nnop\nend");
+    my $status = $test->run(args => "--map " .
+        "@{[$test->workpath('src.nas')]} @{[$test->workpath('src.ngb')]}");
+    is($status, 0, 'Assembly with a source map succeeds');
+
+    my $map;
+    $test->read(\$map, 'src.map');
+    $map //= '';
+    $map =~ s/^[^\t\n]*\t[^\t\n]*\t\K[^\t\n]*src\.nas/src.nas/mg;
+    is($map, "3\t5\tsrc.nas\t2\tmain\n5\t6\tsrc.nas\t5\tloop\n" .
+        "6\t7\tsrc.nas\t6\tloop\n7\t8\tsrc.nas\t0\tloop\n", 'Source map');
+}
+
+# Test dependency files
+{
+    my $test = Test::Cmd->new(prog=>'./ngbasm.py', workdir=>'') or
+        die "Could not create test object for dependency files";
+    $test->write('src.nas', ".include one.nas\n:main\nend");
+    $test->write('one.nas', ".include two.nas\n");
+    $test->write('two.nas', ".const X 1\n");
+    my $status = $test->run(args => "-MD " .
+        "@{[$test->workpath('src.nas')]} @{[$test->workpath('src.ngb')]}");
+    is($status, 0, 'Assembly with a dependency file succeeds');
+
+    my $deps;
+    $test->read(\$deps, 'src.d');
+    $deps //= '';
+    like($deps, qr{^\S*src\.ngb: \S*src\.nas \S*one\.nas \S*two\.nas\n},
+        'Dependency rule lists the source and nested includes');
+    like($deps, qr{^\S*two\.nas:$}m, 'Includes get empty rules');
+
+    # Objects list their includes, and linked images their objects
+    $status = $test->run(args => "-c -MD @{[$test->workpath('src.nas')]}");
+    $status ||= $test->run(args => "--link @{[$test->workpath('src.nobj')]} " .
+        "-o @{[$test->workpath('linked.ngb')]} -MD");
+    is($status, 0, 'Object and link with dependency files succeed');
+
+    $test->read(\$deps, 'src.d');
+    $deps //= '';
+    like($deps, qr{^\S*src\.nobj: \S*src\.nas \S*one\.nas \S*two\.nas\n},
+        'Object dependency rule lists the source and nested includes');
+    $test->read(\$deps, 'linked.d');
+    $deps //= '';
+    like($deps, qr{^\S*linked\.ngb: \S*src\.nobj\n},
+        'Link dependency rule lists the objects');
+}
+
+# Test assembling from standard input, which is read a line at a time
+{
+    my $test = Test::Cmd->new(prog=>'./ngbasm.py', workdir=>'') or
+        die "Could not create test object for standard input";
+    my $status = $test->run(chdir => $test->workdir, args => '',
+        stdin => ".output piped.ngb\n:main\nlit 1\nend\n");
+    is($status, 0, 'Assembly from standard input succeeds');
+
+    my $result;
+    $test->read(\$result, 'piped.ngb');
+    is(unpack('H*', $result // ''),
+        unpack('H*', $preamble . asm(1, 1, 26) . $end),
+        'Image from standard input, named by .output');
+
+    $status = $test->run(chdir => $test->workdir, args => '',
+        stdin => ":main\nnop\nlit 3000000000\n");
+    isnt($status, 0, 'Bad standard input fails');
+    like($test->stderr, qr/standard-input:3:5: Value does not fit in a cell/,
+        'Errors in standard input give the line and column');
+}
+
+# Test extract.py: several pairs at once, --lines, and leaving unchanged
+# output alone
+{
+    my $test = Test::Cmd->new(prog=>'./extract.py', workdir=>'') or
+        die "Could not create test object for extract.py";
+    $test->write('a.md', "Prose\n\n````\n#!/usr/bin/env python3\nA = 1\n" .
+        "````\n\nMore prose\n\n````\nB = 2\n````\n");
+    $test->write('b.md', "````\nC = 3\n````\n");
+    my $status = $test->run(args => join(' ', map { $test->workpath($_) }
+        qw(a.md a.py b.md b.py)));
+    is($status, 0, 'extract.py with two pairs succeeds');
+
+    my ($a, $b);
+    $test->read(\$a, 'a.py');
+    $test->read(\$b, 'b.py');
+    is($a, "#!/usr/bin/env python3\nA = 1\nB = 2\n", 'First pair extracted');
+    is($b, "C = 3\n", 'Second pair extracted');
+
+    # Only the prose changes, so a.py is not written again
+    utime(1, 1, $test->workpath('a.py'));
+    $test->write('a.md', "Other prose\n\n````\n#!/usr/bin/env python3\n" .
+        "A = 1\n````\n\n````\nB = 2\n````\n");
+    $status = $test->run(args => join(' ', map { $test->workpath($_) }
+        qw(a.md a.py)));
+    is($status, 0, 'extract.py with unchanged code succeeds');
+    is((stat $test->workpath('a.py'))[9], 1, 'Unchanged output is not written');
+
+    $status = $test->run(args => join(' ', '--lines',
+        map { $test->workpath($_) } qw(a.md a.py)));
+    is($status, 0, 'extract.py --lines succeeds');
+    $test->read(\$a, 'a.py');
+    $a //= '';
+    $a =~ s/"[^"\n]*a\.md"/"a.md"/g;
+    is($a, "#!/usr/bin/env python3\n# line 5 \"a.md\"\nA = 1\n" .
+        "# line 9 \"a.md\"\nB = 2\n", '--lines marks where each block came from');
+
+    $status = $test->run(args => $test->workpath('a.md'));
+    is($status, 2, 'extract.py rejects an odd number of arguments');
+}
+
+# Test the benchmark harness, on a small program, through `make bench`
+{
+    my $dir = tempdir(CLEANUP => 1);
+    my ($out, $err);
+    run3(['make', '-s', '-f', 'Makefile.in', 'bench',
+            'BENCHFLAGS=-s 200 -r 1 --reserve 1024',
+            "BENCH_RESULTS=$dir/bench.json"], \undef, \$out, \$err);
+    is($?, 0, 'make bench succeeds') or diag($err);
+    my $results = read_file("$dir/bench.json", err_mode => 'quiet') // '';
+    like($results, qr/"lines": 200,/, 'Benchmark results for the size given');
+    like($results, qr/"resolve": [\d.e-]+/, 'Benchmark results for each phase');
+}
+
+# Test running ngbasm straight from the markdown
+{
+    my $test = Test::Cmd->new(prog=>'./mdimport.py', workdir=>'') or
+        die "Could not create test object for mdimport";
+    $test->write('src.nas', ":main\nlit 'A\nout\nend");
+    my $status = $test->run(args => "ngbasm.md " .
+        "@{[$test->workpath('src.nas')]} @{[$test->workpath('src.ngb')]}");
+    is($status, 0, 'ngbasm.md runs through mdimport');
+
+    my $result;
+    $test->read(\$result, 'src.ngb');
+    is(unpack('H*', $result // ''),
+        unpack('H*', $preamble . asm(1, 65, 28, 26) . $end),
+        'Image from ngbasm.md through mdimport');
+
+    # A batch needs the worker function to be found in __main__
+    $test->write('good.nas', ":main\nlit 1\nend");
+    $status = $test->run(args => "ngbasm.md -j 2 --batch " .
+        join(' ', map { $test->workpath($_) }
+            qw(src.nas src2.ngb good.nas good.ngb)));
+    is($status, 0, 'ngbasm.md --batch runs through mdimport');
+    $test->read(\$result, 'good.ngb');
+    is(unpack('H*', $result // ''),
+        unpack('H*', $preamble . asm(1, 1, 26) . $end),
+        'Batch image from ngbasm.md through mdimport');
+
+    # A stale cache is pruned, but not the cache for another Python
+    my $md = read_file('ngbasm.md');
+    $test->write('copy.md', $md);
+    $test->subdir('__pycache__');
+    $test->write('__pycache__/copy.md.0123456789abcdef.other-99.pyc', '');
+    $test->write('__pycache__/copy.md.0123456789abcdef.' .
+        `python3 -c 'import sys; print(sys.implementation.cache_tag)'` =~
+            s/\s+//r . '.pyc', '');
+    $status = $test->run(args => $test->workpath('copy.md') . ' ' .
+        join(' ', map { $test->workpath($_) } qw(good.nas copy.ngb)));
+    is($status, 0, 'A copy of ngbasm.md runs through mdimport');
+    my @cached = sort grep { !/^\./ }
+        map { s{.*/}{}r } glob($test->workpath('__pycache__') . '/*');
+    is(scalar(@cached), 2, 'One cache for this Python, and the other kept');
+    ok((grep { /other-99/ } @cached), 'Cache for another Python is kept');
+    ok(!(grep { /0123456789abcdef\.(?!other)/ } @cached),
+        'Stale cache is pruned');
+}
+
 done_testing();
 
@@ -0,0 +1,54 @@
+use rlib 'lib';
+use DTest;
+use File::Temp qw(tempdir);
+use File::Slurp;
+
+# Profile a small program: a loop that runs three times and calls a routine
+# each time round.  Assemble with a source map, run under `ngb -p`, and check
+# the counts ngbprof.py reports.
+
+my $dir = tempdir(CLEANUP => 1);
+write_file("$dir/prof.nas", <<'EOT');
+:main
+  lit 3
+:loop
+  call &work
+  lit 1
+  sub
+  dup
+  lit &loop
+  cjump
+  drop
+  end
+:work
+  dup
+  drop
+  return
+EOT
+
+my ($out, $err);
+run3(['./ngbasm.py', '--map', "$dir/prof.nas", "$dir/prof.ngb"],
+    \undef, \$out, \$err);
+is($?, 0, 'Assembly with a source map succeeds');
+ok(-e "$dir/prof.map", 'Source map written');
+
+run3(['./ngb', '-p', "$dir/prof.prof", "$dir/prof.ngb"], \undef, \$out, \$err);
+is($?, 0, 'ngb -p succeeds');
+ok(-e "$dir/prof.prof", 'Profile written');
+
+run3(['./ngbprof.py', "$dir/prof.ngb", "$dir/prof.prof"],
+    \undef, \$out, \$err);
+is($?, 0, 'ngbprof.py succeeds');
+is($err, '', 'No stderr');
+
+like($out, qr/^Flat profile \(35 instructions executed\)$/m,
+    'Total instructions executed');
+like($out, qr/^\s*[\d.]+\s+[\d.]+\s+24\s+0\s+33\s+main$/m,
+    'main: self count and cumulative count');
+like($out, qr/^\s*[\d.]+\s+[\d.]+\s+9\s+3\s+9\s+work$/m,
+    'work: called three times');
+like($out, qr/^\s+3\s+9\s+main -> work$/m, 'Call graph edge');
+like($out, qr/^\s*[\d.]+\s+21\s+3\s+loop 5\.\.14 \(prof\.nas:4\)$/m,
+    'Hot loop: body count, header count and source line');
+
+done_testing();
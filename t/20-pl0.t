@@ -0,0 +1,193 @@
+use rlib 'lib';
+use DTest;
+use File::Temp qw(tempdir);
+use File::Slurp;
+
+# Compile PL/0 programs with PL0/pl0-nga.py, assemble them, run them on ngb,
+# and check what they print.  `!` prints each number with numout, so the
+# expected output is built with int2ascii().
+
+sub printed {   # The output of `!` for each of the given numbers
+    return join '', map { $_ < 0 ? '-' . int2ascii(-$_) : int2ascii($_) } @_;
+}
+
+sub pl0 {   # Compile and run PL/0 source.  Returns (output, assembly). {{{1
+    my ($src, $name) = @_;
+    my $dir = tempdir(CLEANUP => 1);
+    my ($out, $err);
+    write_file("$dir/prog.pl0", $src);
+
+    run3(['./PL0/pl0-nga.py', "$dir/prog.pl0", "$dir/prog.nas"],
+        \undef, \$out, \$err);
+    is($?, 0, "$name compiles") or diag($err);
+    run3(['./ngbasm.py', "$dir/prog.nas", "$dir/prog.ngb"],
+        \undef, \$out, \$err);
+    is($?, 0, "$name assembles") or diag($err);
+    run3(['./ngb', "$dir/prog.ngb"], \undef, \$out, \$err);
+    is($?, 0, "$name runs");
+
+    return ($out, scalar read_file("$dir/prog.nas"));
+} # }}}1
+
+# Constant folding, identities, gathering constants, and negation
+{
+    my ($out, $nas) = pl0(<<'EOT', 'Optimizer test');
+CONST K = 3, Z = 0, ONE = 1, M = 8;
+VAR a, b, c;
+BEGIN
+  a := 7; b := -5;
+  ! K * 2 + 1;
+  ! a + 0; ! 0 + a; ! a - 0; ! 0 - a; ! a * 1; ! ONE * a; ! a * Z; ! a / ONE;
+  ! a * (-1); ! a / (-1);
+  ! (a + 1) + 2; ! (a - 1) - 2; ! (a + 1) - 1; ! (a * 2) * 3;
+  ! a * M; ! b * 4; ! b * M * 2;
+  ! a + (-b); ! a - (-b); ! -a + b; ! -(a - b); ! -(-a); ! -K;
+  ! a / 2; ! b / 2; ! b / (-2); ! 17 / 5; ! -17 / 5;
+  ! a * 1073741824;
+  c := a * 0 + b / 1 - (K - 3) * a;
+  ! c
+END.
+EOT
+    is($out, printed(7,
+        7, 7, 7, -7, 7, 7, 0, 7,
+        -7, -7,
+        10, 4, 7, 42,
+        56, -20, -80,
+        12, 2, -12, -12, 7, -3,
+        3, -2, 2, 3, -3,
+        -1073741824,
+        -5), 'Optimized expressions print the right values');
+    is(scalar(() = $nas =~ /^\s*mul$/mg), 1,
+        'Only (a * 2) * 3 is left as a multiplication');
+    like($nas, qr/lit -3\s+shift/, 'Multiplying by 8 is a shift');
+    unlike($nas, qr/lit -1\s+mul/, 'Negation is not a multiplication');
+}
+
+# The example programs.  Until conditions were compiled as a compare and a
+# cjump, WHILE left its loop when the condition was true, so fib.pl0 printed
+# nothing.
+{
+    my ($out, $nas) = pl0(scalar read_file('PL0/fib.pl0'), 'fib.pl0');
+    is($out, printed(1, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233, 377,
+        610, 987, 1597, 2584, 4181, 6765, 10946), 'fib.pl0 output');
+    like($nas, qr/lit 21\s+lt\s+lit &\S+\s+cjump/,
+        'count <= K is one lt against K + 1 and one cjump');
+    unlike($nas, qr/lit &(?!print\n)\S+\s+call/,
+        'The only call is to print');
+
+    ($out) = pl0(scalar read_file('PL0/scope.pl0'), 'scope.pl0');
+    is($out, printed(2, 10), 'scope.pl0 output');
+}
+
+# Every comparison in IF and WHILE, against variables and constants
+{
+    my ($out, $nas) = pl0(<<'EOT', 'Comparison test');
+CONST N = 3;
+VAR i, j, r;
+PROCEDURE t;
+BEGIN
+  r := 0;
+  IF i < j THEN r := r + 1;
+  IF i <= j THEN r := r + 2;
+  IF i > j THEN r := r + 4;
+  IF i >= j THEN r := r + 8;
+  IF i == j THEN r := r + 16;
+  IF i != j THEN r := r + 32;
+  IF i < N THEN r := r + 64;
+  IF i <= N THEN r := r + 128;
+  IF i > N THEN r := r + 256;
+  IF i >= N THEN r := r + 512;
+  IF ODD i THEN r := r + 1024;
+  IF i < 2147483647 THEN r := r + 2048;
+  IF i > -2147483648 THEN r := r + 4096;
+  ! r
+END;
+BEGIN
+  i := 0;
+  WHILE i <= 5 DO BEGIN
+    j := 0;
+    WHILE j < 5 DO BEGIN call t; j := j + 2 END;
+    i := i + 1
+  END;
+  WHILE ODD i DO i := i + 1;
+  WHILE i >= N DO i := i - 1;
+  WHILE i != 0 DO i := i - 1;
+  WHILE i > 2 DO i := i - 1;
+  ! i
+END.
+EOT
+    my @expected;
+    my $N = 3;
+    for my $i (0..5) {
+        for (my $j = 0; $j < 5; $j += 2) {
+            push @expected, ($i < $j) * 1 + ($i <= $j) * 2 + ($i > $j) * 4 +
+                ($i >= $j) * 8 + ($i == $j) * 16 + ($i != $j) * 32 +
+                ($i < $N) * 64 + ($i <= $N) * 128 + ($i > $N) * 256 +
+                ($i >= $N) * 512 + ($i % 2) * 1024 + 2048 + 4096;
+        }
+    }
+    is($out, printed(@expected, 0), 'Comparisons print the right values');
+}
+
+# Name errors: every one is reported, with its position, and nothing is
+# compiled
+{
+    my $dir = tempdir(CLEANUP => 1);
+    my ($out, $err);
+    write_file("$dir/bad.pl0", <<'EOT');
+CONST K = 1;
+VAR v, v;
+PROCEDURE p;
+  v := 1;
+BEGIN
+  K := 2;
+  call v;
+  ! w;
+  v := p
+END.
+EOT
+    run3(['./PL0/pl0-nga.py', "$dir/bad.pl0", "$dir/bad.nas"],
+        \undef, \$out, \$err);
+    is($? >> 8, 1, 'Name errors fail with exit status 1');
+    is($err, <<'EOT', 'Every name error is reported with its position');
+<input>[2:20]: Duplicate declaration of v (first declared at [2:17])
+<input>[6:54]: Assignment to K is a constant
+<input>[7:69]: Call to v is a variable
+<input>[8:76]: Undefined name w
+<input>[9:86]: Value of p is a procedure
+EOT
+    ok(!-e "$dir/bad.nas", 'No assembly is written');
+}
+
+# Deeply nested expressions are parsed and compiled without running into
+# Python's recursion limit
+{
+    my $depth = 3000;
+    my ($out) = pl0(<<"EOT", 'Deep nesting test');
+VAR a;
+BEGIN
+  a := 2;
+  ! @{['(' x $depth]}a@{[')' x $depth]};
+  ! @{[join ' + ', ('a') x $depth]};
+  ! @{['-(' x ($depth + 1)]}a@{[')' x ($depth + 1)]};
+  ! @{['(1 + ' x $depth]}a@{[')' x $depth]} * 3
+END.
+EOT
+    is($out, printed(2, 2 * $depth, -2, 3 * ($depth + 2)),
+        'Deeply nested expressions print the right values');
+}
+
+# The compiler can be used from Python as well as from pl0-nga.py
+{
+    my ($out, $err);
+    run3(['python3', '-c', 'import sys; sys.path.insert(0, "PL0"); ' .
+            'from pl0_compiler import compile_source; ' .
+            'compile_source("VAR a; a := 42.").write(sys.stdout)'],
+        \undef, \$out, \$err);
+    is($?, 0, 'pl0_compiler can be imported') or diag($err);
+    like($out, qr/lit 42\s+lit &\S+\s+store/, 'compile_source() from Python');
+}
+
+done_testing();
+
+# vi: set fdm=marker: #